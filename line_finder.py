@@ -9,6 +9,7 @@ Detects a single white line with these criteria:
 import cv2
 import mss
 import numpy as np
+from numba import njit
 from dataclasses import dataclass
 from typing import Optional, List, Tuple
 
@@ -17,6 +18,9 @@ BLACK_MAX = 40
 MIN_LINE_LENGTH = 30
 MIN_LINE_THICKNESS = 2
 MAX_LINE_THICKNESS = 15
+CONTOUR_SCALE = 2
+USE_OPENCL = cv2.ocl.haveOpenCL() and cv2.ocl.useOpenCL()
+OPENCL_MIN_PIXELS = 640 * 480
 
 
 @dataclass
@@ -29,24 +33,83 @@ class DetectedLine:
     thickness: float
 
 
+@njit(cache=True)
+def _dist2(pts, a, b):
+    dx = pts[a, 0] - pts[b, 0]
+    dy = pts[a, 1] - pts[b, 1]
+    return dx * dx + dy * dy
+
+
+@njit(cache=True)
+def _hull_diameter(pts):
+    best = 0
+    bi, bj = 0, 0
+    n = pts.shape[0]
+    if n <= 4:
+        # Few points, possibly not a hull: check all pairs
+        for i in range(n):
+            for j in range(i + 1, n):
+                d2 = _dist2(pts, i, j)
+                if d2 > best:
+                    best = d2
+                    bi, bj = i, j
+        return bi, bj, best
+    
+    # Rotating calipers: advance the antipodal point while it moves away from edge i -> i+1
+    j = 1
+    for i in range(n):
+        ni = (i + 1) % n
+        ex = pts[ni, 0] - pts[i, 0]
+        ey = pts[ni, 1] - pts[i, 1]
+        while True:
+            nj = (j + 1) % n
+            area_next = abs(ex * (pts[nj, 1] - pts[i, 1]) - ey * (pts[nj, 0] - pts[i, 0]))
+            area_cur = abs(ex * (pts[j, 1] - pts[i, 1]) - ey * (pts[j, 0] - pts[i, 0]))
+            if area_next <= area_cur:
+                break
+            j = nj
+        d2 = _dist2(pts, i, j)
+        if d2 > best:
+            best = d2
+            bi, bj = i, j
+        d2 = _dist2(pts, ni, j)
+        if d2 > best:
+            best = d2
+            bi, bj = ni, j
+    return bi, bj, best
+
+
+@njit(cache=True)
+def _any_black_on_ray(mask, px, py, dx, dy, start, stop):
+    h, w = mask.shape
+    # Branchless: clamp into the image and zero out samples that were outside
+    hit = 0
+    for dist in range(start, stop):
+        x = int(px + dx * dist)
+        y = int(py + dy * dist)
+        inside = (x >= 0) & (x < w) & (y >= 0) & (y < h)
+        hit |= mask[min(max(y, 0), h - 1), min(max(x, 0), w - 1)] * inside
+    return hit != 0
+
+
+_sct = None
+
+
 def capture_screen() -> np.ndarray:
-    with mss.mss() as sct:
-        monitor = sct.monitors[1]
-        screenshot = sct.grab(monitor)
-        img = np.array(screenshot)
-        return cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+    global _sct
+    if _sct is None:
+        _sct = mss.mss()
+    screenshot = _sct.grab(_sct.monitors[1])
+    # BGRA view of the mss buffer; the masks ignore the alpha channel
+    return np.frombuffer(screenshot.raw, dtype=np.uint8).reshape(screenshot.height, screenshot.width, 4)
 
 
 def get_white_mask(img: np.ndarray) -> np.ndarray:
-    b, g, r = cv2.split(img)
-    white_mask = (r >= WHITE_MIN) & (g >= WHITE_MIN) & (b >= WHITE_MIN)
-    return (white_mask * 255).astype(np.uint8)
+    return cv2.inRange(img, np.array([WHITE_MIN] * 3 + [0], np.uint8), np.array([255] * 4, np.uint8))
 
 
 def get_black_mask(img: np.ndarray) -> np.ndarray:
-    b, g, r = cv2.split(img)
-    black_mask = (r <= BLACK_MAX) & (g <= BLACK_MAX) & (b <= BLACK_MAX)
-    return (black_mask * 255).astype(np.uint8)
+    return cv2.inRange(img, np.array([0] * 4, np.uint8), np.array([BLACK_MAX] * 3 + [255], np.uint8))
 
 
 def find_line_endpoints(contour) -> Tuple[Tuple[int, int], Tuple[int, int]]:
@@ -55,7 +118,6 @@ def find_line_endpoints(contour) -> Tuple[Tuple[int, int], Tuple[int, int]]:
     if len(points) < 2:
         return ((0, 0), (0, 0))
     
-    max_dist = 0
     p1, p2 = points[0], points[-1]
     
     if len(points) > 4:
@@ -64,21 +126,16 @@ def find_line_endpoints(contour) -> Tuple[Tuple[int, int], Tuple[int, int]]:
     else:
         hull_points = points
     
-    for i, pt1 in enumerate(hull_points):
-        for pt2 in hull_points[i+1:]:
-            dist = np.sqrt((pt1[0] - pt2[0])**2 + (pt1[1] - pt2[1])**2)
-            if dist > max_dist:
-                max_dist = dist
-                p1, p2 = pt1, pt2
+    pts = hull_points.astype(np.int32)
+    i, j, d2 = _hull_diameter(pts)
+    if d2 > 0:
+        p1, p2 = pts[i], pts[j]
     
     return ((int(p1[0]), int(p1[1])), (int(p2[0]), int(p2[1])))
 
 
-def check_black_at_ends(img: np.ndarray, p1: Tuple[int, int], p2: Tuple[int, int], 
+def check_black_at_ends(black_mask: np.ndarray, p1: Tuple[int, int], p2: Tuple[int, int], 
                          direction: Tuple[float, float], check_radius: int = 20) -> bool:
-    black_mask = get_black_mask(img)
-    h, w = black_mask.shape
-    
     dx, dy = direction
     length = np.sqrt(dx*dx + dy*dy)
     if length == 0:
@@ -86,14 +143,7 @@ def check_black_at_ends(img: np.ndarray, p1: Tuple[int, int], p2: Tuple[int, int
     dx, dy = dx/length, dy/length
     
     def has_black_ahead(px: int, py: int, dir_x: float, dir_y: float) -> bool:
-        for dist in range(3, check_radius):
-            check_x = int(px + dir_x * dist)
-            check_y = int(py + dir_y * dist)
-            
-            if 0 <= check_x < w and 0 <= check_y < h:
-                if black_mask[check_y, check_x] > 0:
-                    return True
-        return False
+        return _any_black_on_ray(black_mask, px, py, dir_x, dir_y, 3, check_radius)
     
     end1_ok = has_black_ahead(p1[0], p1[1], -dx, -dy)
     end2_ok = has_black_ahead(p2[0], p2[1], dx, dy)
@@ -101,18 +151,54 @@ def check_black_at_ends(img: np.ndarray, p1: Tuple[int, int], p2: Tuple[int, int
     return end1_ok or end2_ok
 
 
+def refine_contour(white_mask: np.ndarray, contour, bbox) -> np.ndarray:
+    """Full-resolution contour of a candidate found on the downscaled mask"""
+    x, y, w, h = bbox
+    x0, y0 = max(x - CONTOUR_SCALE, 0), max(y - CONTOUR_SCALE, 0)
+    crop = white_mask[y0:y + h + CONTOUR_SCALE, x0:x + w + CONTOUR_SCALE]
+    
+    # Only the candidate's own pixels: its filled contour, grown to cover the downscale rounding
+    own = np.zeros(crop.shape, np.uint8)
+    cv2.drawContours(own, [contour], -1, 255, cv2.FILLED, offset=(-x0, -y0))
+    own = cv2.dilate(own, np.ones((2 * CONTOUR_SCALE + 1, 2 * CONTOUR_SCALE + 1), np.uint8))
+    
+    found, _ = cv2.findContours(cv2.bitwise_and(crop, own), cv2.RETR_EXTERNAL,
+                                cv2.CHAIN_APPROX_SIMPLE, offset=(x0, y0))
+    if not found:
+        return contour
+    return np.vstack(found)
+
+
 def find_lines(img: np.ndarray) -> List[DetectedLine]:
-    white_mask = get_white_mask(img)
-    contours, _ = cv2.findContours(white_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    # Mask building and downscaling on the GPU via OpenCL when available; small frames stay on the CPU
+    use_gpu = USE_OPENCL and img.shape[0] * img.shape[1] >= OPENCL_MIN_PIXELS
+    src = cv2.UMat(img) if use_gpu else img
+    white_mask = get_white_mask(src)
+    black_mask = get_black_mask(src)
+    # Contours on a downscaled mask, coordinates scaled back to full resolution
+    scale = 1 / CONTOUR_SCALE
+    small = cv2.resize(white_mask, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST)
+    if use_gpu:
+        black_mask = black_mask.get()
+        small = small.get()
+    contours, _ = cv2.findContours(small, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    contours = [c * CONTOUR_SCALE for c in contours]
     
     valid_lines = []
     
-    for contour in contours:
+    # Bounding boxes bound area and length from above, so this cheap pass only
+    # drops contours that the exact checks below would reject anyway
+    bbs = np.array([cv2.boundingRect(c) for c in contours]).reshape(-1, 4)
+    bw, bh = bbs[:, 2], bbs[:, 3]
+    candidates = np.flatnonzero((bw * bh >= 50) & (bw * bw + bh * bh >= MIN_LINE_LENGTH ** 2))
+    
+    for idx in candidates:
+        contour = contours[idx]
         area = cv2.contourArea(contour)
         if area < 50:
             continue
         
-        x, y, w, h = cv2.boundingRect(contour)
+        x, y, w, h = bbs[idx]
         
         if len(contour) >= 5:
             rect = cv2.minAreaRect(contour)
@@ -133,10 +219,14 @@ def find_lines(img: np.ndarray) -> List[DetectedLine]:
         if aspect_ratio < 3:
             continue
         
+        # Endpoints from the full-resolution mask, the 2x downscale costs too much angle precision
+        if isinstance(white_mask, cv2.UMat):
+            white_mask = white_mask.get()
+        contour = refine_contour(white_mask, contour, bbs[idx])
         p1, p2 = find_line_endpoints(contour)
         direction = (p2[0] - p1[0], p2[1] - p1[1])
         
-        if not check_black_at_ends(img, p1, p2, direction):
+        if not check_black_at_ends(black_mask, p1, p2, direction):
             continue
         
         valid_lines.append(DetectedLine(
@@ -150,6 +240,9 @@ def find_lines(img: np.ndarray) -> List[DetectedLine]:
 
 
 def main():
+    # Small per-frame kernels run faster without OpenCV's worker threads
+    cv2.setNumThreads(1)
+    
     print("=" * 50)
     print("  Line detector (for 5-8px thick lines)")
     print("=" * 50)
@@ -184,7 +277,7 @@ def main():
         print(f"   Length: {line.length:.1f}px")
         print(f"   Thickness:  {line.thickness:.1f}px")
         
-        preview = img.copy()
+        preview = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
         
         for l in lines:
             cv2.line(preview, (l.x1, l.y1), (l.x2, l.y2), (128, 128, 128), 2)
@@ -226,7 +319,7 @@ def main():
             print(f"   {i+1}. Area={area:.0f}, L={length:.0f}, D={thickness:.1f}, Aspect={aspect:.1f}")
             print(f"       Endpoints: {p1} → {p2}")
         
-        preview = img.copy()
+        preview = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
         for c, area, length, thickness in big_contours[:10]:
             cv2.drawContours(preview, [c], -1, (0, 255, 0), 2)
             p1, p2 = find_line_endpoints(c)
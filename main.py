@@ -5,41 +5,110 @@ Transparent click-through overlay.
 
 import ctypes
 import sys
+import threading
+import time
 import tkinter as tk
 
 import cv2
 import mss
 import numpy as np
+from numba import njit
 
 GWL_EXSTYLE = -20
 WS_EX_LAYERED = 0x00080000
 WS_EX_TRANSPARENT = 0x00000020
+WDA_EXCLUDEFROMCAPTURE = 0x00000011
+WDA_EXCLUDEFROMCAPTURE_MIN_BUILD = 19041
+VREFRESH = 116
 
-SCAN_INTERVAL_MS = 1
+DEFAULT_REFRESH_HZ = 60
+TIMING_EMA = 0.1
+STATS_INTERVAL_NS = 1_000_000_000
 WHITE_MIN = 240
 BLACK_MAX = 40
 MIN_LINE_LENGTH = 30
 MIN_LINE_THICKNESS = 2
 MAX_LINE_THICKNESS = 15
+CONTOUR_SCALE = 2
+USE_OPENCL = cv2.ocl.haveOpenCL() and cv2.ocl.useOpenCL()
+OPENCL_MIN_PIXELS = 640 * 480
+FRAME_SAMPLE_STEP = 4
+ROI_MARGIN = 64
+ROI_REFRESH_FRAMES = 30
 EXTEND_LENGTH = 2000
 LINE_COLOR = "#00FF00"
 LINE_WIDTH = 3
 
 
+@njit(cache=True)
+def _dist2(pts, a, b):
+    dx = pts[a, 0] - pts[b, 0]
+    dy = pts[a, 1] - pts[b, 1]
+    return dx * dx + dy * dy
+
+
+@njit(cache=True)
+def _hull_diameter(pts):
+    best = 0
+    bi, bj = 0, 0
+    n = pts.shape[0]
+    if n <= 4:
+        # Wenige Punkte, evtl. keine Hülle: alle Paare prüfen
+        for i in range(n):
+            for j in range(i + 1, n):
+                d2 = _dist2(pts, i, j)
+                if d2 > best:
+                    best = d2
+                    bi, bj = i, j
+        return bi, bj, best
+    
+    # Rotating Calipers: Antipodalpunkt weiterschieben, solange er sich von Kante i -> i+1 entfernt
+    j = 1
+    for i in range(n):
+        ni = (i + 1) % n
+        ex = pts[ni, 0] - pts[i, 0]
+        ey = pts[ni, 1] - pts[i, 1]
+        while True:
+            nj = (j + 1) % n
+            area_next = abs(ex * (pts[nj, 1] - pts[i, 1]) - ey * (pts[nj, 0] - pts[i, 0]))
+            area_cur = abs(ex * (pts[j, 1] - pts[i, 1]) - ey * (pts[j, 0] - pts[i, 0]))
+            if area_next <= area_cur:
+                break
+            j = nj
+        d2 = _dist2(pts, i, j)
+        if d2 > best:
+            best = d2
+            bi, bj = i, j
+        d2 = _dist2(pts, ni, j)
+        if d2 > best:
+            best = d2
+            bi, bj = ni, j
+    return bi, bj, best
+
+
+@njit(cache=True)
+def _any_black_on_ray(mask, px, py, dx, dy, start, stop):
+    h, w = mask.shape
+    # Ohne Verzweigungen: in das Bild klemmen, Samples außerhalb ausmaskieren
+    hit = 0
+    for dist in range(start, stop):
+        x = int(px + dx * dist)
+        y = int(py + dy * dist)
+        inside = (x >= 0) & (x < w) & (y >= 0) & (y < h)
+        hit |= mask[min(max(y, 0), h - 1), min(max(x, 0), w - 1)] * inside
+    return hit != 0
+
+
 class LineDetector:
     """Erkennt weiße Linien im Bild"""
     
     @staticmethod
     def get_white_mask(img: np.ndarray) -> np.ndarray:
-        b, g, r = cv2.split(img)
-        white_mask = (r >= WHITE_MIN) & (g >= WHITE_MIN) & (b >= WHITE_MIN)
-        return (white_mask * 255).astype(np.uint8)
+        return cv2.inRange(img, np.array([WHITE_MIN] * 3 + [0], np.uint8), np.array([255] * 4, np.uint8))
     
     @staticmethod
     def get_black_mask(img: np.ndarray) -> np.ndarray:
-        b, g, r = cv2.split(img)
-        black_mask = (r <= BLACK_MAX) & (g <= BLACK_MAX) & (b <= BLACK_MAX)
-        return (black_mask * 255).astype(np.uint8)
+        return cv2.inRange(img, np.array([0] * 4, np.uint8), np.array([BLACK_MAX] * 3 + [255], np.uint8))
     
     @staticmethod
     def find_line_endpoints(contour):
@@ -53,23 +122,17 @@ class LineDetector:
         else:
             hull_points = points
         
-        max_dist = 0
         p1, p2 = points[0], points[-1]
         
-        for i, pt1 in enumerate(hull_points):
-            for pt2 in hull_points[i+1:]:
-                dist = np.sqrt((pt1[0] - pt2[0])**2 + (pt1[1] - pt2[1])**2)
-                if dist > max_dist:
-                    max_dist = dist
-                    p1, p2 = pt1, pt2
+        pts = hull_points.astype(np.int32)
+        i, j, d2 = _hull_diameter(pts)
+        if d2 > 0:
+            p1, p2 = pts[i], pts[j]
         
         return ((int(p1[0]), int(p1[1])), (int(p2[0]), int(p2[1])))
     
     @staticmethod
-    def check_black_at_ends(img: np.ndarray, p1, p2, direction, check_radius=20):
-        black_mask = LineDetector.get_black_mask(img)
-        h, w = black_mask.shape
-        
+    def check_black_at_ends(black_mask: np.ndarray, p1, p2, direction, check_radius=20):
         dx, dy = direction
         length = np.sqrt(dx*dx + dy*dy)
         if length == 0:
@@ -77,27 +140,57 @@ class LineDetector:
         dx, dy = dx/length, dy/length
         
         def has_black_ahead(px, py, dir_x, dir_y):
-            for dist in range(3, check_radius):
-                check_x = int(px + dir_x * dist)
-                check_y = int(py + dir_y * dist)
-                if 0 <= check_x < w and 0 <= check_y < h:
-                    if black_mask[check_y, check_x] > 0:
-                        return True
-            return False
+            return _any_black_on_ray(black_mask, px, py, dir_x, dir_y, 3, check_radius)
         
         end1_ok = has_black_ahead(p1[0], p1[1], -dx, -dy)
         end2_ok = has_black_ahead(p2[0], p2[1], dx, dy)
         
         return end1_ok or end2_ok
     
+    @staticmethod
+    def refine_contour(white_mask: np.ndarray, contour, bbox):
+        """Kontur eines Kandidaten der verkleinerten Maske in voller Auflösung"""
+        x, y, w, h = bbox
+        x0, y0 = max(x - CONTOUR_SCALE, 0), max(y - CONTOUR_SCALE, 0)
+        crop = white_mask[y0:y + h + CONTOUR_SCALE, x0:x + w + CONTOUR_SCALE]
+        
+        # Nur die eigenen Pixel des Kandidaten: gefüllte Kontur, um die Rundung der Verkleinerung erweitert
+        own = np.zeros(crop.shape, np.uint8)
+        cv2.drawContours(own, [contour], -1, 255, cv2.FILLED, offset=(-x0, -y0))
+        own = cv2.dilate(own, np.ones((2 * CONTOUR_SCALE + 1, 2 * CONTOUR_SCALE + 1), np.uint8))
+        
+        found, _ = cv2.findContours(cv2.bitwise_and(crop, own), cv2.RETR_EXTERNAL,
+                                    cv2.CHAIN_APPROX_SIMPLE, offset=(x0, y0))
+        if not found:
+            return contour
+        return np.vstack(found)
+    
     @staticmethod
     def detect(img: np.ndarray):
-        white_mask = LineDetector.get_white_mask(img)
-        contours, _ = cv2.findContours(white_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        # Masken und Verkleinerung per OpenCL auf der GPU; kleine Frames (ROI) bleiben auf der CPU
+        use_gpu = USE_OPENCL and img.shape[0] * img.shape[1] >= OPENCL_MIN_PIXELS
+        src = cv2.UMat(img) if use_gpu else img
+        white_mask = LineDetector.get_white_mask(src)
+        black_mask = LineDetector.get_black_mask(src)
+        # Konturen auf verkleinerter Maske suchen, Koordinaten auf volle Auflösung zurückrechnen
+        scale = 1 / CONTOUR_SCALE
+        small = cv2.resize(white_mask, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST)
+        if use_gpu:
+            black_mask = black_mask.get()
+            small = small.get()
+        contours, _ = cv2.findContours(small, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        contours = [c * CONTOUR_SCALE for c in contours]
         
         valid_lines = []
         
-        for contour in contours:
+        # Bounding Boxes begrenzen Fläche und Länge nach oben: verwirft nur
+        # Konturen, die die genauen Prüfungen unten ohnehin ablehnen würden
+        bbs = np.array([cv2.boundingRect(c) for c in contours]).reshape(-1, 4)
+        bw, bh = bbs[:, 2], bbs[:, 3]
+        candidates = np.flatnonzero((bw * bh >= 50) & (bw * bw + bh * bh >= MIN_LINE_LENGTH ** 2))
+        
+        for idx in candidates:
+            contour = contours[idx]
             area = cv2.contourArea(contour)
             if area < 50:
                 continue
@@ -108,7 +201,7 @@ class LineDetector:
                 thickness = min(rect_w, rect_h)
                 length = max(rect_w, rect_h)
             else:
-                x, y, w, h = cv2.boundingRect(contour)
+                x, y, w, h = bbs[idx]
                 thickness = min(w, h)
                 length = max(w, h)
             
@@ -122,10 +215,14 @@ class LineDetector:
             if aspect_ratio < 3:
                 continue
             
+            # Endpunkte aus der Maske in voller Auflösung, die Verkleinerung kostet zu viel Winkelgenauigkeit
+            if isinstance(white_mask, cv2.UMat):
+                white_mask = white_mask.get()
+            contour = LineDetector.refine_contour(white_mask, contour, bbs[idx])
             p1, p2 = LineDetector.find_line_endpoints(contour)
             direction = (p2[0] - p1[0], p2[1] - p1[1])
             
-            if not LineDetector.check_black_at_ends(img, p1, p2, direction):
+            if not LineDetector.check_black_at_ends(black_mask, p1, p2, direction):
                 continue
             
             valid_lines.append((p1[0], p1[1], p2[0], p2[1], length))
@@ -163,7 +260,34 @@ class TrajectoryOverlay:
         )
         self.canvas.pack()
         
+        # Ein einziges Linien-Item, das nur verschoben wird statt jedes Mal neu erzeugt
+        self.line_id = self.canvas.create_line(
+            0, 0, 0, 0,
+            fill=LINE_COLOR,
+            width=LINE_WIDTH,
+            capstyle=tk.ROUND,
+            state=tk.HIDDEN
+        )
+        self.drawn_line = None
+        self.prev_frame_hash = None
+        
+        # Takt an die Bildwiederholrate koppeln, Laufzeiten pro Stufe als EMA in ms
+        self.frame_ms = 1000 / self.get_refresh_rate()
+        self.timings = {"grab": 0.0, "detect": 0.0, "draw": 0.0, "update": 0.0}
+        self.frames = 0
+        self.stats_start_ns = time.perf_counter_ns()
+        
+        # Ohne Capture-Ausschluss synchron mit Alpha-Flip aufnehmen, sonst sieht der
+        # Screenshot die eigene Linie. Erst mit Ausschluss läuft ein Capture-Thread.
         self.sct = mss.mss()
+        self.monitor = self.sct.monitors[1]
+        self._lock = threading.Lock()
+        self._latest = None
+        self._frame_request = threading.Event()
+        self._roi = None
+        self.roi_frames = 0
+        self._running = True
+        self._capture_thread = None
         
         self.root.after(100, self.make_click_through)
         self.root.after(500, self.update)
@@ -172,21 +296,161 @@ class TrajectoryOverlay:
         print("🎱 Trajectory Overlay started!")
         print("   ESC = Exit")
     
+    @staticmethod
+    def get_refresh_rate():
+        try:
+            hdc = ctypes.windll.user32.GetDC(0)
+            hz = ctypes.windll.gdi32.GetDeviceCaps(hdc, VREFRESH)
+            ctypes.windll.user32.ReleaseDC(0, hdc)
+            # 0 und 1 stehen für "Hardware-Standard"
+            if hz > 1:
+                return hz
+        except Exception as e:
+            print(f"⚠️ Refresh rate error: {e}")
+        return DEFAULT_REFRESH_HZ
+    
+    def record_timing(self, stage, start_ns):
+        ms = (time.perf_counter_ns() - start_ns) / 1e6
+        self.timings[stage] += TIMING_EMA * (ms - self.timings[stage])
+    
+    def report_stats(self):
+        now = time.perf_counter_ns()
+        elapsed = now - self.stats_start_ns
+        if elapsed < STATS_INTERVAL_NS:
+            return
+        fps = self.frames * 1e9 / elapsed
+        stages = ", ".join(f"{k}={v:.1f}ms" for k, v in self.timings.items())
+        print(f"📊 {fps:.1f} FPS ({stages})")
+        self.frames = 0
+        self.stats_start_ns = now
+    
     def make_click_through(self):
         try:
             hwnd = ctypes.windll.user32.GetParent(self.root.winfo_id())
+        except Exception as e:
+            print(f"⚠️ Window handle error: {e}")
+            return
+        
+        try:
             style = ctypes.windll.user32.GetWindowLongW(hwnd, GWL_EXSTYLE)
             new_style = style | WS_EX_LAYERED | WS_EX_TRANSPARENT
             ctypes.windll.user32.SetWindowLongW(hwnd, GWL_EXSTYLE, new_style)
             print("✅ Click-through aktiviert")
         except Exception as e:
             print(f"⚠️ Click-through error: {e}")
+        
+        # Overlay aus Screenshots ausblenden (ab Windows 10 2004), dann kann der
+        # Capture-Thread ohne Alpha-Flip aufnehmen. Sonst bleibt es beim synchronen Grab.
+        # Vor 2004 schlägt der Aufruf nicht fehl, sondern wirkt wie WDA_MONITOR: das
+        # Vollbild-Overlay würde schwarz aufgenommen. Daher Build und Ergebnis prüfen.
+        try:
+            build = sys.getwindowsversion().build
+            if build < WDA_EXCLUDEFROMCAPTURE_MIN_BUILD:
+                raise RuntimeError(f"Windows build {build} < {WDA_EXCLUDEFROMCAPTURE_MIN_BUILD}")
+            if not ctypes.windll.user32.SetWindowDisplayAffinity(hwnd, WDA_EXCLUDEFROMCAPTURE):
+                raise ctypes.WinError()
+            affinity = ctypes.c_uint32()
+            if not ctypes.windll.user32.GetWindowDisplayAffinity(hwnd, ctypes.byref(affinity)):
+                raise ctypes.WinError()
+            if affinity.value != WDA_EXCLUDEFROMCAPTURE:
+                raise RuntimeError(f"display affinity is {affinity.value:#x}")
+            print("✅ Overlay von Screenshots ausgeschlossen")
+        except Exception as e:
+            print(f"⚠️ Display affinity error: {e}")
+            print("   Fallback: synchroner Screenshot mit Alpha-Flip")
+            return
+        
+        self.start_capture_thread()
+    
+    def capture_screen(self, sct, monitor):
+        screenshot = sct.grab(monitor)
+        # BGRA-View auf den mss-Puffer (keine Kopie), die Masken ignorieren den Alpha-Kanal
+        return np.frombuffer(screenshot.raw, dtype=np.uint8).reshape(screenshot.height, screenshot.width, 4)
+    
+    @staticmethod
+    def roi_region(monitor, roi):
+        """Bildschirmbereich für die ROI (auf den Monitor begrenzt) und dessen Offset"""
+        if roi is not None:
+            x1, y1 = max(roi[0], 0), max(roi[1], 0)
+            x2, y2 = min(roi[2], monitor["width"]), min(roi[3], monitor["height"])
+            if x2 > x1 and y2 > y1:
+                region = {
+                    "left": monitor["left"] + x1,
+                    "top": monitor["top"] + y1,
+                    "width": x2 - x1,
+                    "height": y2 - y1,
+                }
+                return region, x1, y1
+        return monitor, 0, 0
     
-    def capture_screen(self):
-        monitor = self.sct.monitors[1]
-        screenshot = self.sct.grab(monitor)
-        img = np.array(screenshot)
-        return cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+    def start_capture_thread(self):
+        # Nur aufrufen, wenn das Overlay von Screenshots ausgeschlossen ist
+        if self._capture_thread is None:
+            self._capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
+            self._capture_thread.start()
+    
+    def grab_frame(self):
+        if self._capture_thread is not None:
+            # Neuesten Screenshot übernehmen (ältere Frames werden verworfen)
+            with self._lock:
+                frame = self._latest
+                self._latest = None
+            return frame
+        
+        roi = self._roi
+        region, ox, oy = self.roi_region(self.monitor, roi)
+        
+        # Overlay transparent machen für Screenshot (kein Blinken!)
+        self.root.attributes("-alpha", 0)
+        self.root.update_idletasks()
+        try:
+            start = time.perf_counter_ns()
+            img = self.capture_screen(self.sct, region)
+            self.record_timing("grab", start)
+        finally:
+            # Overlay wieder sichtbar, auch wenn der Screenshot fehlschlägt
+            self.root.attributes("-alpha", 1)
+        return (img, ox, oy, roi)
+    
+    def _capture_loop(self):
+        # mss-Instanzen sind thread-gebunden, daher hier erzeugen
+        with mss.mss() as sct:
+            monitor = sct.monitors[1]
+            while self._running:
+                # Höchstens ein Grab pro update(), statt ungenutzte Frames am Stück aufzunehmen
+                if not self._frame_request.wait(timeout=0.5):
+                    continue
+                self._frame_request.clear()
+                
+                with self._lock:
+                    roi = self._roi
+                region, ox, oy = self.roi_region(monitor, roi)
+                
+                # Fehler (z.B. Sperrbildschirm, UAC) nur melden, der Thread läuft weiter
+                try:
+                    start = time.perf_counter_ns()
+                    img = self.capture_screen(sct, region)
+                    self.record_timing("grab", start)
+                except Exception as e:
+                    print(f"❌ Capture error: {e}")
+                    continue
+                with self._lock:
+                    self._latest = (img, ox, oy, roi)
+    
+    def update_roi(self, line):
+        # Ohne Treffer oder alle ROI_REFRESH_FRAMES Frames wieder den ganzen Bildschirm scannen
+        self.roi_frames += 1
+        if line is None or self.roi_frames >= ROI_REFRESH_FRAMES:
+            roi = None
+            self.roi_frames = 0
+        else:
+            x1, y1, x2, y2 = line
+            roi = (
+                min(x1, x2) - ROI_MARGIN, min(y1, y2) - ROI_MARGIN,
+                max(x1, x2) + ROI_MARGIN, max(y1, y2) + ROI_MARGIN,
+            )
+        with self._lock:
+            self._roi = roi
     
     def extend_line_full(self, x1, y1, x2, y2):
         dx = x2 - x1
@@ -209,45 +473,75 @@ class TrajectoryOverlay:
         return (new_x1, new_y1, new_x2, new_y2)
     
     def draw_line(self, x1, y1, x2, y2):
-        self.canvas.delete("all")
-        self.canvas.create_line(
-            x1, y1, x2, y2,
-            fill=LINE_COLOR,
-            width=LINE_WIDTH,
-            capstyle=tk.ROUND
-        )
+        line = (x1, y1, x2, y2)
+        if line == self.drawn_line:
+            return
+        self.canvas.coords(self.line_id, *line)
+        if self.drawn_line is None:
+            self.canvas.itemconfigure(self.line_id, state=tk.NORMAL)
+        self.drawn_line = line
+    
+    def clear_line(self):
+        if self.drawn_line is None:
+            return
+        self.canvas.itemconfigure(self.line_id, state=tk.HIDDEN)
+        self.drawn_line = None
     
     def update(self):
+        update_start = time.perf_counter_ns()
+        
         try:
-            # Overlay transparent machen für Screenshot (kein Blinken!)
-            self.root.attributes("-alpha", 0)
-            self.root.update_idletasks()
+            frame = self.grab_frame()
             
-            # Screenshot
-            img = self.capture_screen()
+            img = None
+            if frame is not None:
+                img, ox, oy, roi = frame
+                # Unveränderte Frames überspringen. Jede 4. Zeile/Spalte reicht, da eine
+                # 5-8px dicke Linie jede abgetastete Zeile/Spalte, die sie kreuzt, trifft
+                frame_hash = hash(img[::FRAME_SAMPLE_STEP, ::FRAME_SAMPLE_STEP].tobytes())
+                if frame_hash == self.prev_frame_hash:
+                    img = None
+                self.prev_frame_hash = frame_hash
             
-            # Overlay wieder sichtbar
-            self.root.attributes("-alpha", 1)
-            
-            # Linie erkennen
-            line = LineDetector.detect(img)
-            
-            if line:
-                x1, y1, x2, y2 = line
-                # Linie in beide Richtungen verlängern
-                ex1, ey1, ex2, ey2 = self.extend_line_full(x1, y1, x2, y2)
-                # Zeichnen
-                self.draw_line(ex1, ey1, ex2, ey2)
-            else:
-                self.canvas.delete("all")
+            if img is not None:
+                # Linie erkennen
+                start = time.perf_counter_ns()
+                line = LineDetector.detect(img)
+                self.record_timing("detect", start)
+                
+                start = time.perf_counter_ns()
+                if line:
+                    # ROI-Koordinaten auf Bildschirmkoordinaten umrechnen
+                    x1, y1, x2, y2 = line[0] + ox, line[1] + oy, line[2] + ox, line[3] + oy
+                    line = (x1, y1, x2, y2)
+                    # Linie in beide Richtungen verlängern
+                    ex1, ey1, ex2, ey2 = self.extend_line_full(x1, y1, x2, y2)
+                    # Zeichnen
+                    self.draw_line(ex1, ey1, ex2, ey2)
+                elif roi is None:
+                    # Nur nach einem Vollbild-Scan löschen, ein Fehlschlag in der ROI lässt die Linie stehen
+                    self.clear_line()
+                self.record_timing("draw", start)
+                self.frames += 1
+                self.update_roi(line)
         
         except Exception as e:
             print(f"❌ Error: {e}")
         
-        self.root.after(SCAN_INTERVAL_MS, self.update)
+        # Nächsten Screenshot anfordern (mit der eben gesetzten ROI), er läuft während der Wartezeit
+        self._frame_request.set()
+        
+        self.record_timing("update", update_start)
+        self.report_stats()
+        
+        # Nächsten Durchlauf zum nächsten Bildwechsel abzüglich der eigenen Laufzeit
+        delay = max(1, int(self.frame_ms - self.timings["update"]))
+        self.root.after(delay, self.update)
     
     def quit(self):
         print("👋 Closing overlay...")
+        self._running = False
+        self._frame_request.set()
         self.root.destroy()
         sys.exit(0)
     
@@ -256,6 +550,9 @@ class TrajectoryOverlay:
 
 
 def main():
+    # Kleine Kernels pro Frame laufen ohne OpenCV-Worker-Threads schneller
+    cv2.setNumThreads(1)
+    
     print("=" * 50)
     print("  🎱 8 Ball Pool Trajectory Overlay")
     print("=" * 50)